@@ -3,12 +3,14 @@ import datetime
 import fnmatch
 import logging
 import os
+import sqlite3
 import stat
 import sys
 import time
 from collections import Counter
 
-from pdf_annotations_to_readwise import PDFPair, extract, readwise, report
+from pdf_annotations_to_readwise import (PDFPair, export, extract, index,
+                                        readwise, report)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("main")
@@ -37,11 +39,52 @@ def parse_args() -> argparse.Namespace:
                       required=True)
     sync.set_defaults(func=sync_command)
 
-    for command in check, sync:
-        command.add_argument("-i", "--ignore", action="append",
+    index_ = subparsers.add_parser(
+        "index", help="Update the local annotation index, without syncing")
+    index_.set_defaults(func=index_command)
+
+    search = subparsers.add_parser(
+        "search", help="Search the local annotation index")
+    search.add_argument("query", nargs="?",
+                        help="Words to search for")
+    search.add_argument("--raw", action="store_true",
+                        help="Treat the query as SQLite FTS5 syntax")
+    search.add_argument("-a", "--author", help="Annotation author")
+    search.add_argument("--since", type=datetime.date.fromisoformat,
+                        help="Earliest date, YYYY-MM-DD, in the time zone "
+                             "each highlight was made in")
+    search.add_argument("--until", type=datetime.date.fromisoformat,
+                        help="Latest date, YYYY-MM-DD, in the time zone "
+                             "each highlight was made in")
+    search.add_argument("-n", "--limit", type=int, default=50,
+                        help="Max results, 0 for unlimited")
+    search.set_defaults(func=search_command)
+
+    export_ = subparsers.add_parser(
+        "export", help="Export highlights to a file for Readwise import")
+    export_.add_argument("-o", "--output", help="Output path", required=True)
+    export_.add_argument("-f", "--format", choices=export.FORMATS,
+                         default="jsonl",
+                         help="csv for Readwise's CSV import; "
+                              "can't be synced later")
+    export_.set_defaults(func=export_command)
+
+    replay = subparsers.add_parser(
+        "replay", help="Post highlights from an exported JSONL file")
+    replay.add_argument("-t", "--token", help="Readwise access token",
+                        required=True)
+    replay.add_argument("input", help="JSONL file written by export")
+    replay.set_defaults(func=replay_command)
+
+    for command in check, sync, index_, export_:
+        command.add_argument("-i", "--ignore", action="append", default=[],
                              help="File(s) to ignore, glob patterns allowed")
         command.add_argument("directory", nargs="+", type=directory_type)
 
+    for command in sync, index_, search:
+        command.add_argument("--db", default=index.DEFAULT_PATH,
+                             help="Annotation index path")
+
     args = parser.parse_args()
     if not args.func:
         parser.print_help()
@@ -174,16 +217,19 @@ def sync_command(args: argparse.Namespace) -> int:
     all_pairs = todo | done
     # Map: book title -> book info dict.
     books = readwise.list_books(args.token)
-    for pair in sorted(all_pairs, key=lambda p: p.original):
+    conn = index.connect(args.db)
+    # An annotated PDF may lack an original, so sort by the annotated path.
+    for pair in sorted(all_pairs, key=lambda p: p.annotated or p.original):
         if not pair.annotated:
             continue
 
         title = os.path.basename(pair.annotated)
         anns = extract.annotations(pair.annotated)
-        if anns.check_ids():
+        if anns is None or anns.check_ids():
             logging.error("Skipping %s", pair.annotated)
             continue
 
+        index.store(conn, pair.annotated, anns)
         if title in books:
             book_id = books[title]["id"]
             highlights = readwise.list_highlights(args.token, book_id)
@@ -201,9 +247,89 @@ def sync_command(args: argparse.Namespace) -> int:
 
         readwise.post_highlights(token=args.token, anns=anns)
 
+    index.prune(conn, args.directory,
+                {p.annotated for p in all_pairs if p.annotated})
     return exit_code
 
 
+def index_command(args: argparse.Namespace) -> int:
+    todo, done = find_pdfs(args)
+    annotated = {p.annotated for p in todo | done if p.annotated}
+    conn = index.connect(args.db)
+    counter = Counter()
+    for path in sorted(annotated):
+        result = index.update(conn, path)
+        if result is index.Update.UPDATED:
+            logging.info("Indexed '%s'", os.path.basename(path))
+
+        counter[result] += 1
+
+    pruned = index.prune(conn, args.directory, annotated)
+    logging.info("%d PDFs updated, %d failed, %d removed from index",
+                 counter[index.Update.UPDATED],
+                 counter[index.Update.FAILED],
+                 pruned)
+    return 1 if counter[index.Update.FAILED] else 0
+
+
+def search_command(args: argparse.Namespace) -> int:
+    if not os.path.exists(args.db):
+        logging.error("No index at %s, run 'index' or 'sync' first", args.db)
+        return 1
+
+    conn = index.connect(args.db)
+    results = index.search(conn,
+                           query=args.query,
+                           raw=args.raw,
+                           author=args.author,
+                           since=args.since,
+                           until=args.until,
+                           limit=args.limit)
+    try:
+        for title, a in results:
+            dt = a.dt.date() if a.dt else ""
+            print(f"{title}, page {a.page_number + 1}, {a.author or ''} {dt}")
+            print(f"    {a.text}")
+    except sqlite3.OperationalError as exc:
+        logging.error("Bad query '%s': %s", args.query, exc)
+        return 1
+
+    return 0
+
+
+def export_command(args: argparse.Namespace) -> int:
+    todo, done = find_pdfs(args)
+    annotated = sorted(p.annotated for p in todo | done if p.annotated)
+    count = 0
+    # Write each PDF's highlights as soon as they're extracted, so memory use
+    # doesn't grow with the size of the library.
+    with open(args.output, "w", newline="") as f:
+        write = export.writer(f, args.format)
+        for path in annotated:
+            anns = extract.annotations(path)
+            if anns is None or anns.check_ids():
+                logging.error("Skipping %s", path)
+                continue
+
+            for h in export.highlights(anns):
+                write(h)
+                count += 1
+
+            f.flush()
+
+    logging.info("Exported %d highlights to %s", count, args.output)
+    return 0
+
+
+def replay_command(args: argparse.Namespace) -> int:
+    with open(args.input) as f:
+        count = readwise.post_highlight_batches(
+            args.token, export.read_jsonl(f))
+
+    logging.info("Posted %d highlights from %s", count, args.input)
+    return 0
+
+
 def main(args: argparse.Namespace) -> None:
     start = time.time()
     exit_code = args.func(args)
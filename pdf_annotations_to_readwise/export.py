@@ -0,0 +1,59 @@
+import csv
+import json
+import typing
+from typing import Callable, Iterator
+
+from pdf_annotations_to_readwise import extract, readwise
+
+FORMATS = ("jsonl", "csv")
+
+# Columns of Readwise's bulk CSV import, readwise.io/import_bulk. There's no
+# room for highlight_url or source_type, so sync can't find highlights loaded
+# this way and posts them again; JSONL and replay keep them.
+_CSV_FIELDS = ["Highlight", "Title", "Author", "URL", "Note", "Location",
+               "Date"]
+
+
+def highlights(anns: extract.Annotations) -> Iterator[dict]:
+    """Yield anns as Readwise highlight dicts, as post_highlights sends them.
+
+    Free texts get an inline ".freetext" tag in their note, since a bulk
+    import can't tag them afterward like post_highlights does.
+    """
+    for a in anns.underlines:
+        yield readwise.highlight_json(anns.source_title, a)
+
+    for a in anns.free_texts:
+        yield {**readwise.highlight_json(anns.source_title, a),
+               "note": ".freetext"}
+
+
+def writer(out: typing.TextIO, fmt: str) -> Callable[[dict], None]:
+    """Return a function that writes one highlight dict to out."""
+    if fmt == "jsonl":
+        def write(h: dict) -> None:
+            out.write(json.dumps(h) + "\n")
+    elif fmt == "csv":
+        w = csv.DictWriter(out, fieldnames=_CSV_FIELDS)
+        w.writeheader()
+
+        def write(h: dict) -> None:
+            w.writerow({
+                "Highlight": h["text"],
+                "Title": h["title"],
+                "Author": "",
+                # Readwise treats URL as the book's source, not a highlight id.
+                "URL": "",
+                "Note": h.get("note", ""),
+                "Location": h["location"],
+                "Date": h["highlighted_at"] or ""})
+    else:
+        raise ValueError(f"Bad export format: {fmt}")
+
+    return write
+
+
+def read_jsonl(f: typing.TextIO) -> Iterator[dict]:
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
@@ -130,7 +130,8 @@ def _annotations(pdf_path: str, q: multiprocessing.Queue) -> None:
     q.put(anns)
 
 
-def annotations(pdf_path: str) -> Annotations:
+def annotations(pdf_path: str) -> Optional[Annotations]:
+    """Extract annotations, or return None if mupdf crashed."""
     # mupdf is crashy; avoid terminating the whole script.
     q = multiprocessing.Queue()
     p = multiprocessing.Process(target=_annotations, args=(pdf_path, q))
@@ -139,11 +140,11 @@ def annotations(pdf_path: str) -> Annotations:
     if 0 != p.exitcode:
         _logger.error("Subprocess failed with exit code: %s, file: %s",
                       p.exitcode, pdf_path)
-        return Annotations(source_title=os.path.split(pdf_path)[-1])
+        return None
 
     return q.get()
 
 
 def has_annotations(pdf_path: str) -> bool:
     anns = annotations(pdf_path)
-    return bool(anns.free_texts or anns.underlines)
+    return bool(anns and (anns.free_texts or anns.underlines))
@@ -0,0 +1,213 @@
+import datetime
+import enum
+import logging
+import os
+import sqlite3
+from typing import Iterator, Optional
+
+from pdf_annotations_to_readwise import extract
+
+DEFAULT_PATH = os.path.expanduser("~/.pdf-annotations-to-readwise.sqlite")
+
+_logger = logging.getLogger("index")
+
+# Annotations live in an ordinary table so author and date queries can use
+# B-tree indexes; the FTS5 table indexes only the text, borrowing rows from
+# "annotations" as its external content. Triggers keep the two in step.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS annotations (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    source_title TEXT NOT NULL,
+    type TEXT NOT NULL,
+    text TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    author TEXT,
+    dt TEXT,
+    date TEXT,
+    -- A copy of a PDF has the same annotation ids, each copy keeps its own.
+    UNIQUE (path, id)
+);
+CREATE INDEX IF NOT EXISTS annotations_author ON annotations(author);
+CREATE INDEX IF NOT EXISTS annotations_date ON annotations(date);
+CREATE VIRTUAL TABLE IF NOT EXISTS annotations_fts USING fts5(
+    text, content='annotations', content_rowid='rowid');
+CREATE TRIGGER IF NOT EXISTS annotations_ai AFTER INSERT ON annotations BEGIN
+    INSERT INTO annotations_fts(rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS annotations_ad AFTER DELETE ON annotations BEGIN
+    INSERT INTO annotations_fts(annotations_fts, rowid, text)
+        VALUES ('delete', old.rowid, old.text);
+END;
+"""
+
+# Bump when _SCHEMA changes. The index is only a cache of what's in the PDFs,
+# so an old one is dropped and rebuilt rather than migrated.
+_SCHEMA_VERSION = 2
+
+_DROP = """
+DROP TABLE IF EXISTS annotations_fts;
+DROP TABLE IF EXISTS annotations;
+DROP TABLE IF EXISTS files;
+"""
+
+
+def connect(db_path: str = DEFAULT_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    # Fire the delete trigger when INSERT OR REPLACE evicts a row.
+    conn.execute("PRAGMA recursive_triggers = ON")
+    if conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+        conn.executescript(_DROP)
+        conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def is_stale(conn: sqlite3.Connection, pdf_path: str) -> bool:
+    """True if pdf_path changed since it was last indexed, or never was."""
+    pdf_path = os.path.abspath(pdf_path)
+    st = os.stat(pdf_path)
+    row = conn.execute("SELECT mtime, size FROM files WHERE path = ?",
+                       (pdf_path,)).fetchone()
+    return row != (st.st_mtime, st.st_size)
+
+
+def store(conn: sqlite3.Connection,
+          pdf_path: str,
+          anns: extract.Annotations) -> None:
+    """Replace everything indexed for pdf_path with anns."""
+    pdf_path = os.path.abspath(pdf_path)
+    st = os.stat(pdf_path)
+    with conn:
+        conn.execute("DELETE FROM files WHERE path = ?", (pdf_path,))
+        conn.execute("INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)",
+                     (pdf_path, st.st_mtime, st.st_size))
+        conn.executemany(
+            "INSERT OR REPLACE INTO annotations"
+            " (id, path, source_title, type, text, page_number, author, dt,"
+            " date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            # Keep dt's own offset, and filter on the date in that offset:
+            # the day the highlight was made, wherever the reader was.
+            [(a.id, pdf_path, anns.source_title, a.type, a.text,
+              a.page_number, a.author,
+              a.dt.isoformat() if a.dt else None,
+              a.dt.date().isoformat() if a.dt else None)
+             for a in anns.free_texts + anns.underlines])
+
+
+def prune(conn: sqlite3.Connection,
+          roots: list[str],
+          pdf_paths: set[str]) -> int:
+    """Forget indexed files that no longer exist, or that are under one of
+    roots but not in pdf_paths. Return how many were forgotten."""
+    roots = [os.path.abspath(root) for root in roots]
+    pdf_paths = {os.path.abspath(path) for path in pdf_paths}
+
+    def is_gone(path: str) -> bool:
+        if not os.path.exists(path):
+            return True
+
+        return (path not in pdf_paths
+                and any(path.startswith(root + os.sep) for root in roots))
+
+    gone = [path for (path,) in conn.execute("SELECT path FROM files")
+            if is_gone(path)]
+    with conn:
+        conn.executemany("DELETE FROM files WHERE path = ?",
+                         [(path,) for path in gone])
+
+    return len(gone)
+
+
+class Update(enum.Enum):
+    UNCHANGED = enum.auto()
+    UPDATED = enum.auto()
+    FAILED = enum.auto()
+
+
+def update(conn: sqlite3.Connection, pdf_path: str) -> Update:
+    """Re-extract pdf_path if it changed since it was indexed."""
+    if not is_stale(conn, pdf_path):
+        return Update.UNCHANGED
+
+    # On failure, leave pdf_path stale so the next update retries it.
+    anns = extract.annotations(pdf_path)
+    if anns is None or anns.check_ids():
+        _logger.error("Not indexing %s", pdf_path)
+        return Update.FAILED
+
+    store(conn, pdf_path, anns)
+    return Update.UPDATED
+
+
+def _quote(query: str) -> str:
+    # Match each term literally, so "write-ahead" or "C++" aren't FTS5 syntax.
+    return " ".join('"' + t.replace('"', '""') + '"' for t in query.split())
+
+
+def search(conn: sqlite3.Connection,
+           query: Optional[str] = None,
+           raw: bool = False,
+           author: Optional[str] = None,
+           since: Optional[datetime.date] = None,
+           until: Optional[datetime.date] = None,
+           limit: Optional[int] = None
+           ) -> Iterator[tuple[str, extract.Annotation]]:
+    """Yield (source title, annotation) pairs, best matches first.
+
+    Each term of query must appear, unless raw is True, in which case query
+    is passed to FTS5 as is and may raise sqlite3.OperationalError. since
+    and until are inclusive, and compare with the date in each highlight's
+    own time zone.
+    """
+    where = []
+    params = []
+    if query and query.strip():
+        sql = ("SELECT a.source_title, a.type, a.id, a.text, a.page_number,"
+               " a.author, a.dt FROM annotations_fts"
+               " JOIN annotations a ON a.rowid = annotations_fts.rowid")
+        where.append("annotations_fts MATCH ?")
+        params.append(query if raw else _quote(query))
+        order = "annotations_fts.rank"
+    else:
+        sql = ("SELECT a.source_title, a.type, a.id, a.text, a.page_number,"
+               " a.author, a.dt FROM annotations a")
+        order = "a.date DESC, a.dt DESC"
+
+    if author:
+        where.append("a.author = ?")
+        params.append(author)
+
+    if since:
+        where.append("a.date >= ?")
+        params.append(since.isoformat())
+
+    if until:
+        where.append("a.date <= ?")
+        params.append(until.isoformat())
+
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+    sql += f" ORDER BY {order}"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    for title, type_, id_, text, page_number, author_, dt in conn.execute(
+            sql, params):
+        yield title, extract.Annotation(
+            type_,
+            id_,
+            text,
+            page_number,
+            author=author_,
+            dt=datetime.datetime.fromisoformat(dt) if dt else None)
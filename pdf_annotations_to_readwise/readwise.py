@@ -1,38 +1,60 @@
+import itertools
 import logging
+import time
+from typing import Iterable, Optional
 
 import requests
 
 from pdf_annotations_to_readwise import extract
 
 _APP_NAME = "pdf-annotations-to-readwise"
+_BATCH_SIZE = 1000
+_MAX_ATTEMPTS = 5
 _logger = logging.getLogger("readwise")
 
 
-def _readwise_api(token: str, method: str, endpoint: str, **kwargs) -> dict:
-    response = requests.request(
-        method=method,
-        url=f"https://readwise.io/api/v2/{endpoint}/",
-        headers={"Authorization": f"Token {token}"},
-        **kwargs)
+def _retry_after(response: requests.Response) -> int:
+    # Retry-After may also be an HTTP-date, don't bother parsing it.
+    try:
+        return int(response.headers.get("Retry-After", 60))
+    except ValueError:
+        return 60
+
+
+def _readwise_api(token: str, method: str, endpoint: str,
+                  **kwargs) -> Optional[dict]:
+    for attempt in range(1, _MAX_ATTEMPTS + 1):
+        response = requests.request(
+            method=method,
+            url=f"https://readwise.io/api/v2/{endpoint}/",
+            headers={"Authorization": f"Token {token}"},
+            **kwargs)
+        if response.status_code != 429 or attempt == _MAX_ATTEMPTS:
+            break
+
+        delay = _retry_after(response)
+        _logger.info("Rate limited, retrying in %d seconds", delay)
+        time.sleep(delay)
+
     response.raise_for_status()
-    return response.json()
+    # DELETE replies "204 No Content".
+    return response.json() if response.content else None
 
 
-def _readwise_get(token: str, endpoint: str, query: dict) -> dict:
+def _readwise_get(token: str, endpoint: str, query: dict) -> list[dict]:
     rv = _readwise_api(token, "get", endpoint, params=query)
+    assert rv is not None, f"Empty reply from {endpoint}"
     assert rv["next"] is None, "TODO: pagination"
     return rv["results"]
 
 
-def _readwise_post(token: str, endpoint: str, data: dict) -> dict:
+def _readwise_post(token: str, endpoint: str,
+                   data: dict) -> Optional[dict]:
     return _readwise_api(token, "post", endpoint, json=data)
 
 
 def _readwise_delete(token: str, endpoint: str) -> None:
-    response = requests.delete(
-        url=f"https://readwise.io/api/v2/{endpoint}/",
-        headers={"Authorization": f"Token {token}"})
-    response.raise_for_status()
+    _readwise_api(token, "delete", endpoint)
 
 
 def list_books(token: str) -> dict[str, dict]:
@@ -65,19 +87,24 @@ def add_highlight_tag(token: str, highlight_url: str, tag: str) -> None:
         raise
 
 
+def highlight_json(source_title: str, a: extract.Annotation) -> dict:
+    return {
+        "text": a.text,
+        "title": source_title,
+        "location": a.page_number + 1,
+        # None if the PDF has no date for the annotation.
+        "highlighted_at": a.dt.isoformat() if a.dt else None,
+        # id isn't a URL, but it's unique!
+        "highlight_url": a.id,
+        "category": "books",
+        "location_type": "page",
+        "source_type": _APP_NAME
+    }
+
+
 def post_highlights(token: str, anns: extract.Annotations) -> None:
     def highlights_json(annotations: list[extract.Annotation]) -> list[dict]:
-        return [{
-            "text": a.text,
-            "title": anns.source_title,
-            "location": a.page_number + 1,
-            "highlighted_at": a.dt.isoformat(),
-            # id isn't a URL, but it's unique!
-            "highlight_url": a.id,
-            "category": "books",
-            "location_type": "page",
-            "source_type": _APP_NAME
-        } for a in annotations]
+        return [highlight_json(anns.source_title, a) for a in annotations]
 
     # Readwise returns HTTP 400 if highlights is an empty list.
     if anns.underlines:
@@ -95,3 +122,18 @@ def post_highlights(token: str, anns: extract.Annotations) -> None:
         for book_info in free_texts_reply:
             for highlight_id in book_info.get("modified_highlights", []):
                 add_highlight_tag(token, highlight_id, "freetext")
+
+
+def post_highlight_batches(token: str, highlights: Iterable[dict]) -> int:
+    """POST highlight dicts in large batches, return how many were sent.
+
+    Tags must be inline in each highlight's "note", e.g. ".freetext".
+    """
+    highlights = iter(highlights)
+    count = 0
+    while batch := list(itertools.islice(highlights, _BATCH_SIZE)):
+        _readwise_post(token, "highlights", {"highlights": batch})
+        count += len(batch)
+        _logger.info("Posted %d highlights", count)
+
+    return count